@@ -1,11 +1,28 @@
 import os
+import asyncio
+import json
+import math
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager, suppress
 from fastapi import FastAPI, HTTPException, Query, Path
-from fastapi.responses import JSONResponse, RedirectResponse
-from pydantic import BaseModel, Field
-from typing import Optional, List, Any, Dict
+from fastapi.responses import ORJSONResponse, PlainTextResponse, RedirectResponse
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.backends.redis import RedisBackend
+from fastapi_cache.decorator import cache
+from redis import asyncio as aioredis
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Any
 from mem0 import Memory
+from mem0.embeddings.together import TogetherEmbedding
+from mem0.vector_stores.pgvector import OutputData, PGVector
 from dotenv import load_dotenv
-import psycopg2
+import asyncpg
+import numpy as np
 
 import logging
 
@@ -28,82 +45,276 @@ LLM_MODEL = os.environ.get("LLM_MODEL", "mistralai/Mistral-7B-Instruct-v0.2")
 EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "togethercomputer/m2-bert-80M-8k-retrieval")
 HISTORY_DB_PATH = os.environ.get("HISTORY_DB_PATH", "/app/history/history.db")
 
+# Fail fast on a missing key instead of surfacing it as a 500 from inside mem0
+if not TOGETHER_API_KEY:
+    raise RuntimeError("TOGETHER_API_KEY must be set")
+
 # Set environment variables that mem0ai uses internally
 os.environ["TOGETHER_API_KEY"] = TOGETHER_API_KEY
 # OpenAI API key is still needed for some fallback functionality
-os.environ["OPENAI_API_KEY"] = TOGETHER_API_KEY
+os.environ.setdefault("OPENAI_API_KEY", TOGETHER_API_KEY)
+
+# Semantic search cache: entry count (0 disables), cosine similarity for a hit, and entry lifetime in seconds
+SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", "4096"))
+SEARCH_CACHE_THRESHOLD = float(os.environ.get("SEARCH_CACHE_THRESHOLD", "0.95"))
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", "300"))
+
+# Response cache for single-memory reads: Redis when REDIS_URL is set, otherwise in-process
+REDIS_URL = os.environ.get("REDIS_URL")
+MEMORY_CACHE_TTL = int(os.environ.get("MEMORY_CACHE_TTL", "60"))
+
+# asyncpg pool sizing for the connections the server opens itself
+POSTGRES_POOL_MIN_SIZE = int(os.environ.get("POSTGRES_POOL_MIN_SIZE", "10"))
+POSTGRES_POOL_MAX_SIZE = int(os.environ.get("POSTGRES_POOL_MAX_SIZE", "50"))
+
+# Worker threads for blocking mem0 calls; matches anyio's default instead of asyncio's min(32, cpu + 4)
+THREADPOOL_SIZE = int(os.environ.get("THREADPOOL_SIZE", "40"))
+
+# HNSW search breadth used by every vector store session; tuned to the collection size unless set
+HNSW_EF_SEARCH = int(os.environ["HNSW_EF_SEARCH"]) if os.environ.get("HNSW_EF_SEARCH") else None
+# Development safety net: make a missed vector index fail loudly instead of falling back to a sequential scan
+POSTGRES_DISABLE_SEQSCAN = os.environ.get("POSTGRES_DISABLE_SEQSCAN", "false").lower() == "true"
+# Expose /debug/* endpoints such as the search query plan
+ENABLE_DEBUG_ENDPOINTS = os.environ.get("ENABLE_DEBUG_ENDPOINTS", "false").lower() == "true"
+
+# Approximate index on the vector column of mem0's collection: "hnsw", "ivfflat" or "none"
+VECTOR_INDEX_TYPE = os.environ.get("VECTOR_INDEX_TYPE", "hnsw")
+if VECTOR_INDEX_TYPE not in ("hnsw", "ivfflat", "none"):
+    raise ValueError(f"VECTOR_INDEX_TYPE must be 'hnsw', 'ivfflat' or 'none', got {VECTOR_INDEX_TYPE!r}")
+# IVFFlat lists probed per query
+IVFFLAT_PROBES = int(os.environ.get("IVFFLAT_PROBES", "10"))
+# Keep scanning the vector index until enough rows pass the identifier filters (pgvector >= 0.8)
+PGVECTOR_ITERATIVE_SCAN = os.environ.get("PGVECTOR_ITERATIVE_SCAN", "true").lower() == "true"
+
+# maintenance_work_mem for the vector index build at startup
+POSTGRES_MAINT_WORK_MEM = os.environ.get("POSTGRES_MAINT_WORK_MEM", "2GB")
+
+# Storage precision of the vector column: "half" (halfvec, FP16) or "full" (vector, FP32)
+EMBEDDING_PRECISION = os.environ.get("EMBEDDING_PRECISION", "half")
+if EMBEDDING_PRECISION not in ("half", "full"):
+    raise ValueError(f"EMBEDDING_PRECISION must be 'half' or 'full', got {EMBEDDING_PRECISION!r}")
+EMBEDDING_TYPE = "halfvec" if EMBEDDING_PRECISION == "half" else "vector"
+
+
+def configure_hnsw_params(vector_count):
+    """Pick HNSW build and search parameters for the number of stored vectors."""
+    # An HNSW scan returns at most ef_search rows and mem0 searches with limit=100,
+    # so ef_search never drops below 100
+    if vector_count < 100_000:
+        params = {"m": 16, "ef_construction": 64, "ef_search": 100}
+    elif vector_count < 1_000_000:
+        params = {"m": 24, "ef_construction": 128, "ef_search": 100}
+    else:
+        params = {"m": 32, "ef_construction": 200, "ef_search": 200}
+    if HNSW_EF_SEARCH is not None:
+        params["ef_search"] = HNSW_EF_SEARCH
+    return params
+
+
+def quote_ident(name):
+    """Quote a table or index name for interpolation into SQL."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def collection_ident(name):
+    """Quote a mem0 collection name so it resolves to the same relation as mem0's unquoted SQL."""
+    # Postgres folds unquoted identifiers to lower case
+    return quote_ident(name.lower())
+
 
-# Initialize database with pgvector extension and required tables
-def setup_database():
+def index_name(collection_name, column):
+    """Quoted name of the server's index on `column` of a mem0 collection."""
+    return collection_ident(f"idx_{collection_name}_{column}")
+
+
+# Type of each collection's vector column as last seen by setup_database, keyed by folded name
+_VECTOR_COLUMN_TYPES = {}
+
+
+def vector_column_type(collection_name):
+    """Type to cast query vectors to for `collection_name`; mem0 creates the column as vector."""
+    return _VECTOR_COLUMN_TYPES.get(collection_name.lower(), "vector")
+
+
+# Add the pgvector and identifier indices mem0 does not create on its collection
+async def setup_database(pool, collection_name):
+    table = collection_ident(collection_name)
+    vector_index = index_name(collection_name, "vector")
     try:
-        conn = psycopg2.connect(
-            host=POSTGRES_HOST,
-            port=POSTGRES_PORT,
-            dbname=POSTGRES_DB,
-            user=POSTGRES_USER,
-            password=POSTGRES_PASSWORD
-        )
-        conn.autocommit = True
-        cursor = conn.cursor()
-        
-        # Create pgvector extension if it doesn't exist
-        cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'vector')")
-        extension_exists = cursor.fetchone()[0]
-        
-        if not extension_exists:
-            logging.info("Creating pgvector extension...")
-            cursor.execute("CREATE EXTENSION IF NOT EXISTS vector")
-            logging.info("pgvector extension created successfully")
-        
-        # Check if memories table exists and create it if needed
-        cursor.execute(f"""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_name = '{POSTGRES_COLLECTION_NAME}'
+        async with pool.acquire() as conn:
+            # Fetch everything the vector index depends on in a single query; to_regclass
+            # resolves each name with one catalog lookup and yields NULL when it does not exist.
+            # For vector and halfvec columns atttypmod is the number of dimensions.
+            # The same query gives an index build more memory and parallel workers; the pool
+            # resets these on release. maintenance_work_mem is bound since it comes from the environment
+            state = await conn.fetchrow(
+                """
+                SELECT
+                    (SELECT t.typname FROM pg_attribute a JOIN pg_type t ON t.oid = a.atttypid
+                     WHERE a.attrelid = to_regclass($1) AND a.attname = 'vector') AS vector_type,
+                    (SELECT a.atttypmod FROM pg_attribute a
+                     WHERE a.attrelid = to_regclass($1) AND a.attname = 'vector') AS dims,
+                    (SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass($1)) AS row_count,
+                    (SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass($2)) AS index_invalid,
+                    (SELECT am.amname FROM pg_class c JOIN pg_am am ON am.oid = c.relam
+                     WHERE c.oid = to_regclass($2)) AS index_method,
+                    (SELECT reloptions FROM pg_class WHERE oid = to_regclass($2)) AS index_options,
+                    set_config('max_parallel_maintenance_workers', '7', false),
+                    set_config('max_parallel_workers', '8', false),
+                    set_config('maintenance_work_mem', $3, false)
+                """,
+                table,
+                vector_index,
+                POSTGRES_MAINT_WORK_MEM,
             )
-        """)
-        table_exists = cursor.fetchone()[0]
-        
-        if not table_exists:
-            logging.info(f"Creating {POSTGRES_COLLECTION_NAME} table...")
-            
-            # Create the memories table with pgvector support
-            # This is a basic schema - mem0ai will typically handle this,
-            # but we're creating it just in case
-            cursor.execute(f"""
-                CREATE TABLE IF NOT EXISTS {POSTGRES_COLLECTION_NAME} (
-                    id UUID PRIMARY KEY,
-                    content TEXT NOT NULL,
-                    metadata JSONB,
-                    user_id TEXT,
-                    agent_id TEXT,
-                    run_id TEXT,
-                    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-                    embedding vector(1536)
+            # mem0 creates the collection as (id, vector, payload) when it starts up
+            if state["vector_type"] is None:
+                logging.error(f"Collection {collection_name} has no vector column; it is created by mem0")
+                return None
+
+            # Convert the vector column if it was created with another precision.
+            # The operator class is tied to the column type, so the index is rebuilt below
+            column_type = state["vector_type"]
+            _VECTOR_COLUMN_TYPES[collection_name.lower()] = column_type
+            existing_index = state["index_method"]
+            if column_type != EMBEDDING_TYPE:
+                dims = state["dims"]
+                logging.info(f"Migrating {collection_name}.vector from {column_type} to {EMBEDDING_TYPE}...")
+                try:
+                    # Databases created before pgvector 0.7 need the extension updated for halfvec
+                    await conn.execute(f"""
+                        ALTER EXTENSION vector UPDATE;
+                        DROP INDEX IF EXISTS {vector_index};
+                        ALTER TABLE {table}
+                        ALTER COLUMN vector TYPE {EMBEDDING_TYPE}({dims}) USING vector::{EMBEDDING_TYPE}({dims});
+                    """)
+                except asyncpg.PostgresError as e:
+                    # The batch runs in one transaction, so the column and its index are untouched
+                    logging.error(f"Keeping {collection_name}.vector as {column_type}; migration failed: {str(e)}")
+                else:
+                    existing_index = None
+                    column_type = EMBEDDING_TYPE
+                    _VECTOR_COLUMN_TYPES[collection_name.lower()] = column_type
+                    logging.info(f"{collection_name}.vector migrated successfully")
+
+            # reltuples is the planner's row estimate. It is -1 until the table is first analyzed,
+            # which a restored or bulk-loaded table may never have been, so count the rows then
+            row_count = state["row_count"] or 0
+            if row_count < 0:
+                row_count = await conn.fetchval(f"SELECT count(*) FROM {table}")
+            index_type = VECTOR_INDEX_TYPE
+            if index_type == "ivfflat" and row_count < 100:
+                # IVFFlat lists are trained on the rows present at build time
+                logging.info(f"Skipping IVFFlat index: ~{row_count} rows are too few to train its lists")
+                index_type = "none"
+
+            # mem0 filters on identifiers stored inside the payload. These statements are sent
+            # together with whatever the vector index needs below, in as few round-trips as possible
+            logging.info(f"Ensuring identifier indices on {collection_name}...")
+            ddl = f"""
+                CREATE INDEX IF NOT EXISTS {index_name(collection_name, "user_id")} ON {table} ((payload->>'user_id'));
+                CREATE INDEX IF NOT EXISTS {index_name(collection_name, "agent_id")} ON {table} ((payload->>'agent_id'));
+                CREATE INDEX IF NOT EXISTS {index_name(collection_name, "run_id")} ON {table} ((payload->>'run_id'));
+            """
+
+            # Keep exactly one vector index. An interrupted concurrent build also leaves an
+            # invalid index behind that IF NOT EXISTS would keep
+            if existing_index and (state["index_invalid"] or existing_index != index_type):
+                logging.info(f"Dropping {existing_index} index {vector_index}")
+                ddl += f"DROP INDEX IF EXISTS {vector_index};"
+                existing_index = None
+
+            if index_type == "none":
+                await conn.execute(ddl)
+                return {}
+
+            rebuild = False
+            if index_type == "hnsw":
+                # Size the graph for the current collection, and regrow an existing graph once
+                # the collection reaches another tier so it matches the ef_search chosen for it
+                index_params = configure_hnsw_params(row_count)
+                if existing_index:
+                    options = dict(option.split("=", 1) for option in state["index_options"] or ())
+                    # Options left unset at build time are pgvector's defaults
+                    built = (int(options.get("m", 16)), int(options.get("ef_construction", 64)))
+                    rebuild = built != (index_params["m"], index_params["ef_construction"])
+                index_method = (
+                    f"hnsw (vector {column_type}_cosine_ops) "
+                    f"WITH (m = {index_params['m']}, ef_construction = {index_params['ef_construction']})"
                 )
-            """)
-            
-            # Add indices for faster queries
-            cursor.execute(f"""
-                CREATE INDEX IF NOT EXISTS idx_{POSTGRES_COLLECTION_NAME}_user_id ON {POSTGRES_COLLECTION_NAME}(user_id);
-                CREATE INDEX IF NOT EXISTS idx_{POSTGRES_COLLECTION_NAME}_agent_id ON {POSTGRES_COLLECTION_NAME}(agent_id);
-                CREATE INDEX IF NOT EXISTS idx_{POSTGRES_COLLECTION_NAME}_run_id ON {POSTGRES_COLLECTION_NAME}(run_id);
-                CREATE INDEX IF NOT EXISTS idx_{POSTGRES_COLLECTION_NAME}_embedding ON {POSTGRES_COLLECTION_NAME} USING ivfflat (embedding vector_cosine_ops);
-            """)
-            
-            logging.info(f"{POSTGRES_COLLECTION_NAME} table created successfully")
-            
-        cursor.close()
-        conn.close()
-        return True
+            else:
+                index_params = {"lists": max(1, math.ceil(math.sqrt(row_count)))}
+                index_method = f"ivfflat (vector {column_type}_cosine_ops) WITH (lists = {index_params['lists']})"
+            logging.info(f"{index_type} index parameters for ~{row_count} rows: {index_params}")
+
+            if rebuild:
+                # Build the replacement next to the live index and swap them in one transaction,
+                # so searches keep an index for the whole rebuild
+                logging.info(f"Rebuilding {vector_index} from m, ef_construction = {built}")
+                rebuild_index = index_name(collection_name, "vector_rebuild")
+                # An interrupted rebuild leaves an invalid index behind
+                await conn.execute(ddl + f"DROP INDEX IF EXISTS {rebuild_index};")
+                # CONCURRENTLY cannot run inside the implicit transaction of a multi-statement query
+                await conn.execute(f"CREATE INDEX CONCURRENTLY {rebuild_index} ON {table} USING {index_method}")
+                await conn.execute(f"""
+                    DROP INDEX {vector_index};
+                    ALTER INDEX {rebuild_index} RENAME TO {vector_index};
+                """)
+            elif existing_index:
+                # The index already matches; a warm start needs only the probe and this batch
+                await conn.execute(ddl)
+            elif row_count == 0:
+                # An empty table builds instantly, so the index joins the batch. A table analyzed
+                # while empty may hold a few rows by now; locking those briefly is harmless
+                await conn.execute(ddl + f"CREATE INDEX IF NOT EXISTS {vector_index} ON {table} USING {index_method};")
+            else:
+                # Build without blocking writes on a populated table
+                await conn.execute(ddl)
+                await conn.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {vector_index} ON {table} USING {index_method}")
+
+        return index_params
     except Exception as e:
         logging.error(f"Error setting up database: {str(e)}")
-        return False
-
-# Make sure the database is properly set up
-setup_result = setup_database()
-logging.info(f"Database setup result: {setup_result}")
+        return None
+
+
+def vector_session_settings(ef_search):
+    """Session settings applied to every connection that runs vector searches."""
+    settings = {"hnsw.ef_search": str(ef_search)}
+    if VECTOR_INDEX_TYPE == "ivfflat":
+        settings["ivfflat.probes"] = str(IVFFLAT_PROBES)
+    if PGVECTOR_ITERATIVE_SCAN:
+        # Filters are applied after the index scan, so without this a user who owns a small share
+        # of the rows gets back only the few of their memories that fall in the first candidates.
+        # IVFFlat only supports relaxed ordering; pooled searches re-sort its results
+        settings["hnsw.iterative_scan"] = "strict_order"
+        settings["ivfflat.iterative_scan"] = "relaxed_order"
+    if POSTGRES_DISABLE_SEQSCAN:
+        settings["enable_seqscan"] = "off"
+    return settings
+
+
+def pool_connect_args(ef_search):
+    """Connection arguments for pooled connections."""
+    return {
+        "host": POSTGRES_HOST,
+        "port": int(POSTGRES_PORT),
+        "database": POSTGRES_DB,
+        "user": POSTGRES_USER,
+        "password": POSTGRES_PASSWORD,
+        # Startup parameters become the session defaults the pool restores on release
+        "server_settings": vector_session_settings(ef_search),
+    }
+
+
+def create_pool(ef_search):
+    """Create the asyncpg connection pool shared by all endpoints."""
+    return asyncpg.create_pool(
+        min_size=POSTGRES_POOL_MIN_SIZE,
+        max_size=POSTGRES_POOL_MAX_SIZE,
+        max_inactive_connection_lifetime=300,
+        **pool_connect_args(ef_search),
+    )
 
 DEFAULT_CONFIG = {
     "version": "v1.1",
@@ -135,131 +346,521 @@ DEFAULT_CONFIG = {
     "history_db_path": HISTORY_DB_PATH,
 }
 
-# Initialize memory instance with default configuration
-try:
-    logging.info("Initializing memory with config: %s", DEFAULT_CONFIG)
-    MEMORY_INSTANCE = Memory.from_config(DEFAULT_CONFIG)
-    logging.info("Memory initialization successful")
-except Exception as e:
-    logging.error(f"Configuration validation error: {str(e)}")
-    raise
+# Identifier fields mem0 scopes memories by, in the order used for cache scopes
+_IDENT = ("user_id", "agent_id", "run_id")
+
+
+def _identifier_params(user_id, agent_id, run_id):
+    """Build mem0 keyword arguments from the identifiers that were provided."""
+    params = {}
+    for key, value in zip(_IDENT, (user_id, agent_id, run_id)):
+        if value is not None:
+            params[key] = value
+    return params
+
+
+class SemanticSearchCache:
+    """LRU cache of search responses, matched by query embedding similarity within a scope."""
+
+    def __init__(self, max_entries, threshold, ttl):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # One unit-length embedding per slot; free slots stay zero so they never match
+        self._matrix = None
+        # slot -> (scope, response, timestamp), least recently used first
+        self._entries = OrderedDict()
+        self._free = list(range(max_entries))
+        # Bumped by every invalidation so responses computed across a write are not stored
+        self.generation = 0
+
+    def get(self, scope, embedding):
+        """Return the cached response closest to `embedding` for `scope`, or None."""
+        with self._lock:
+            if not self._entries or self._matrix.shape[1] != embedding.shape[0]:
+                return None
+            sims = self._matrix @ embedding
+            candidates = np.flatnonzero(sims >= self.threshold)
+            now = time.monotonic()
+            for slot in candidates[np.argsort(-sims[candidates])]:
+                entry_scope, response, timestamp = self._entries[slot]
+                if entry_scope != scope:
+                    continue
+                if now - timestamp > self.ttl:
+                    self._evict(slot)
+                    continue
+                self._entries.move_to_end(slot)
+                return response
+            return None
+
+    def put(self, scope, embedding, response, generation):
+        """Store `response` unless an invalidation ran since `generation` was read, evicting the LRU entry when full."""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            if self._matrix is None or self._matrix.shape[1] != embedding.shape[0]:
+                self._matrix = np.zeros((self.max_entries, embedding.shape[0]), dtype=np.float32)
+                self._entries.clear()
+                self._free = list(range(self.max_entries))
+            if not self._free:
+                self._evict(next(iter(self._entries)))
+            slot = self._free.pop()
+            self._matrix[slot] = embedding
+            self._entries[slot] = (scope, response, time.monotonic())
+
+    def invalidate(self, identifiers=None):
+        """Drop entries whose scope shares an identifier with `identifiers`, or everything if None."""
+        with self._lock:
+            self.generation += 1
+            if identifiers is None:
+                self._entries.clear()
+                self._free = list(range(self.max_entries))
+                if self._matrix is not None:
+                    self._matrix[:] = 0
+                return
+            keys = [identifiers.get(k) for k in _IDENT]
+            stale = [
+                slot for slot, (scope, _, _) in self._entries.items()
+                if any(key is not None and key == scoped for key, scoped in zip(keys, scope))
+            ]
+            for slot in stale:
+                self._evict(slot)
+
+    def _evict(self, slot):
+        del self._entries[slot]
+        self._matrix[slot] = 0
+        self._free.append(slot)
+
+
+_QCACHE = SemanticSearchCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_THRESHOLD, SEARCH_CACHE_TTL)
+
+# Embeddings computed ahead of a mem0 call, keyed by text, so mem0 does not request them again
+_PRECOMPUTED_EMBEDDINGS = {}
+
+
+@contextmanager
+def precomputed_embeddings(embeddings):
+    """Serve the given text -> vector mapping from the embedder for the duration of the block."""
+    _PRECOMPUTED_EMBEDDINGS.update(embeddings)
+    try:
+        yield
+    finally:
+        for text in embeddings:
+            _PRECOMPUTED_EMBEDDINGS.pop(text, None)
+
+
+def _install_precomputed_embeddings(embedder):
+    embed = embedder.embed
+
+    def embed_with_precomputed(text, memory_action=None):
+        vector = _PRECOMPUTED_EMBEDDINGS.get(text)
+        if vector is not None:
+            return vector
+        return embed(text, memory_action)
+
+    embedder.embed = embed_with_precomputed
+
+
+def batch_embed(embedder, texts):
+    """Embed `texts` with a single provider request, returning a text -> vector mapping."""
+    texts = list(dict.fromkeys(texts))
+    # Only the Together embedder is a plain pass-through to the client, so only it can be batched safely
+    if not texts or not isinstance(embedder, TogetherEmbedding):
+        return {}
+    response = embedder.client.embeddings.create(model=embedder.config.model, input=texts)
+    return {text: item.embedding for text, item in zip(texts, response.data)}
+
+
+def _unit_vector(embedding):
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _search_cache_scope(params):
+    # mem0 accepts identifiers inside filters too, with top-level ones taking precedence;
+    # fold them into the identifier fields so writes under that identifier invalidate the entry
+    filters = dict(params.get("filters") or {})
+    identifiers = [filters.pop(key, None) for key in _IDENT]
+    return (
+        *(params.get(key, identifier) for key, identifier in zip(_IDENT, identifiers)),
+        json.dumps(filters, sort_keys=True, default=str) if filters else None,
+    )
+
+
+def _payload_filters_param(filters):
+    """Encode the non-identifier filters for the pooled search, or None when there are none."""
+    extra = {key: str(value) for key, value in (filters or {}).items() if key not in _IDENT}
+    return json.dumps(extra) if extra else None
+
+
+def _pgvector_search_sql(collection_name):
+    # Identifier filters are optional parameters so one statement covers every search shape.
+    # Other filters compare payload->>key with the value as text, the same test mem0's own search uses.
+    # ORDER BY uses the bare <=> operator on the column's own type so the planner can walk the vector index
+    column_type = vector_column_type(collection_name)
+    return f"""
+        SELECT id, vector <=> $1::{column_type} AS distance, payload
+        FROM {collection_ident(collection_name)}
+        WHERE ($3::text IS NULL OR payload->>'user_id' = $3)
+          AND ($4::text IS NULL OR payload->>'agent_id' = $4)
+          AND ($5::text IS NULL OR payload->>'run_id' = $5)
+          AND ($6::jsonb IS NULL OR NOT EXISTS (
+                SELECT 1 FROM jsonb_each_text($6::jsonb) f WHERE payload->>f.key IS DISTINCT FROM f.value
+              ))
+        ORDER BY vector <=> $1::{column_type}
+        LIMIT $2
+    """
+
+
+def _install_pooled_search(vector_store, state):
+    """Route mem0's pgvector searches through the shared asyncpg pool."""
+
+    def pooled_search(query, vectors, limit=5, filters=None):
+        filters = filters or {}
+        # Built per call because setup_database may migrate the column after the hook is installed
+        sql = _pgvector_search_sql(vector_store.collection_name)
+        identifiers = [str(filters[key]) if key in filters else None for key in _IDENT]
+        # asyncpg prepares the statement once per pooled connection and reuses it from its statement cache
+        rows = asyncio.run_coroutine_threadsafe(
+            state.pool.fetch(sql, str(vectors), limit, *identifiers, _payload_filters_param(filters)), state.loop
+        ).result()
+        results = [
+            OutputData(id=str(row["id"]), score=float(row["distance"]), payload=json.loads(row["payload"]))
+            for row in rows
+        ]
+        if VECTOR_INDEX_TYPE == "ivfflat" and PGVECTOR_ITERATIVE_SCAN:
+            results.sort(key=lambda result: result.score)
+        return results
+
+    vector_store.search = pooled_search
+
+
+def _pgvector_delete_all_sql(collection_name):
+    return f"""
+        DELETE FROM {collection_ident(collection_name)}
+        WHERE ($1::text IS NULL OR payload->>'user_id' = $1)
+          AND ($2::text IS NULL OR payload->>'agent_id' = $2)
+          AND ($3::text IS NULL OR payload->>'run_id' = $3)
+        RETURNING id, payload->>'data' AS data
+    """
+
+
+def _install_pooled_delete_all(memory, state):
+    """Replace mem0's get-and-delete loop with a single DELETE ... RETURNING on the shared pool."""
+
+    def pooled_delete_all(user_id=None, agent_id=None, run_id=None):
+        filters = _identifier_params(user_id, agent_id, run_id)
+        if not filters:
+            raise ValueError(
+                "At least one filter is required to delete all memories. If you want to delete all memories, use the `reset()` method."
+            )
+        sql = _pgvector_delete_all_sql(memory.vector_store.collection_name)
+        rows = asyncio.run_coroutine_threadsafe(
+            state.pool.fetch(sql, *(filters.get(key) for key in _IDENT)), state.loop
+        ).result()
+
+        # Record the deletions in one batch, matching what mem0's add_history writes per memory
+        with memory.db._lock, memory.db.connection:
+            memory.db.connection.executemany(
+                """
+                INSERT INTO history (id, memory_id, old_memory, new_memory, event, created_at, updated_at, is_deleted)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                [(str(uuid.uuid4()), str(row["id"]), row["data"], None, "DELETE", None, None, 1) for row in rows],
+            )
+        logging.info(f"Deleted {len(rows)} memories")
+
+        if memory.enable_graph:
+            memory.graph.delete_all(filters)
+
+        return {"message": "Memories deleted successfully!"}
+
+    memory.delete_all = pooled_delete_all
+
+
+def _uses_server_database(vector_store_config):
+    return (
+        getattr(vector_store_config, "host", None) == POSTGRES_HOST
+        and str(getattr(vector_store_config, "port", None)) == str(POSTGRES_PORT)
+        and getattr(vector_store_config, "dbname", None) == POSTGRES_DB
+        and getattr(vector_store_config, "user", None) == POSTGRES_USER
+    )
+
+
+def apply_vector_session_settings(vector_store, ef_search):
+    """Apply the vector search session settings to mem0's own pgvector connection."""
+    for name, value in vector_session_settings(ef_search).items():
+        vector_store.cur.execute(f"SET {name} = {value}")
+    vector_store.conn.commit()
+
+
+def configure_vector_store(memory, state):
+    """Tune mem0's pgvector session and, when it shares our database, serve searches from the pool."""
+    vector_store = memory.vector_store
+    if not isinstance(vector_store, PGVector):
+        return
+    apply_vector_session_settings(vector_store, state.ef_search)
+    if _uses_server_database(memory.config.vector_store.config):
+        _install_pooled_search(vector_store, state)
+
+
+def build_memory(config, state):
+    """Create a Memory instance wired to the server's embedding and vector store hooks."""
+    memory = Memory.from_config(config)
+    _install_precomputed_embeddings(memory.embedding_model)
+    configure_vector_store(memory, state)
+    if isinstance(memory.vector_store, PGVector) and _uses_server_database(memory.config.vector_store.config):
+        _install_pooled_delete_all(memory, state)
+    return memory
+
+
+async def prepare_vector_store(memory, state):
+    """Index mem0's collection when it lives in our database and tune searches to its size."""
+    vector_store = memory.vector_store
+    if not isinstance(vector_store, PGVector) or not _uses_server_database(memory.config.vector_store.config):
+        return
+    index_params = await setup_database(state.pool, vector_store.collection_name)
+    logging.info(f"Database setup result: {index_params is not None}")
+
+    # Reopen pooled connections with the ef_search tuned for this collection
+    if index_params and index_params.get("ef_search", state.ef_search) != state.ef_search:
+        state.ef_search = index_params["ef_search"]
+        state.pool.set_connect_args(**pool_connect_args(state.ef_search))
+        await state.pool.expire_connections()
+        await asyncio.to_thread(apply_vector_session_settings, vector_store, state.ef_search)
+
+
+# Endpoints whose responses are cached per memory
+_MEMORY_CACHE_ENDPOINTS = ("get_memory", "memory_history")
+
+
+def _memory_cache_key(func, namespace="", *, request=None, response=None, args=(), kwargs=None):
+    # One key per memory and endpoint so writes can invalidate exactly the affected memory
+    return f"{namespace}:{kwargs['memory_id']}:{func.__name__}"
+
+
+async def invalidate_memory_cache(memory_id=None):
+    """Drop cached reads for one memory, or for every memory."""
+    # The write has already been applied, so a cache failure is logged rather than failing the request
+    try:
+        if memory_id is None:
+            await FastAPICache.clear(namespace="memory")
+            return
+        # Delete the known keys directly; clearing a namespace scans the whole Redis keyspace
+        backend = FastAPICache.get_backend()
+        namespace = f"{FastAPICache.get_prefix()}:memory"
+        for endpoint in _MEMORY_CACHE_ENDPOINTS:
+            try:
+                await backend.clear(key=f"{namespace}:{memory_id}:{endpoint}")
+            except KeyError:
+                # InMemoryBackend raises for keys that were never cached
+                pass
+    except Exception:
+        logging.exception("Error invalidating cached memory reads:")
+
+
+# Memory instance, created on startup once the database is set up
+MEMORY_INSTANCE = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global MEMORY_INSTANCE
+    backend = RedisBackend(aioredis.from_url(REDIS_URL)) if REDIS_URL else InMemoryBackend()
+    FastAPICache.init(backend, prefix="mem0", expire=MEMORY_CACHE_TTL)
+    app.state.loop = asyncio.get_running_loop()
+    # asyncio.to_thread runs on the default executor, which asyncio sizes from the CPU count
+    app.state.loop.set_default_executor(ThreadPoolExecutor(max_workers=THREADPOOL_SIZE, thread_name_prefix="mem0"))
+    app.state.ef_search = HNSW_EF_SEARCH or 100
+    app.state.pool = await create_pool(app.state.ef_search)
+    try:
+        # Initialize memory instance with default configuration; mem0 creates its collection here
+        try:
+            logging.info("Initializing memory with config: %s", DEFAULT_CONFIG)
+            MEMORY_INSTANCE = await asyncio.to_thread(build_memory, DEFAULT_CONFIG, app.state)
+            logging.info("Memory initialization successful")
+        except Exception as e:
+            logging.error(f"Configuration validation error: {str(e)}")
+            raise
+
+        # Index the collection in the background: a long (re)build would otherwise keep the server
+        # from answering, while searches can use the existing index or an exact scan meanwhile
+        app.state.setup_task = asyncio.create_task(prepare_vector_store(MEMORY_INSTANCE, app.state))
+
+        yield
+    finally:
+        setup_task = getattr(app.state, "setup_task", None)
+        if setup_task is not None:
+            # An interrupted concurrent build leaves an invalid index that the next startup replaces
+            setup_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await setup_task
+        await app.state.pool.close()
+
 
 app = FastAPI(
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     title="Mem0 REST APIs",
     description="A REST API for managing and searching memories for your AI Agents and Apps.",
     version="1.0.0",
 )
 
 
-class Message(BaseModel):
+class _RequestModel(BaseModel):
+    """Base for request bodies: immutable once parsed, and unknown fields are rejected."""
+
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
+
+class Message(_RequestModel):
     role: str = Field(..., description="Role of the message (user or assistant).")
     content: str = Field(..., description="Message content.")
 
 
-class MemoryCreate(BaseModel):
-    messages: List[Message] = Field(..., description="List of messages to store.")
-    user_id: Optional[str] = None
-    agent_id: Optional[str] = None
-    run_id: Optional[str] = None
-    metadata: Optional[Dict[str, Any]] = None
+class MemoryCreate(_RequestModel):
+    messages: list[Message] = Field(..., description="List of messages to store.")
+    user_id: str | None = None
+    agent_id: str | None = None
+    run_id: str | None = None
+    metadata: dict[str, Any] | None = None
+    infer: bool | None = Field(None, description="Extract facts with the LLM (default) or store messages as-is.")
 
 
-class SearchRequest(BaseModel):
+class SearchRequest(_RequestModel):
     query: str = Field(..., description="Search query.")
-    user_id: Optional[str] = None
-    run_id: Optional[str] = None
-    agent_id: Optional[str] = None
-    filters: Optional[Dict[str, Any]] = None
+    user_id: str | None = None
+    run_id: str | None = None
+    agent_id: str | None = None
+    filters: dict[str, Any] | None = None
 
 
 @app.post("/configure", summary="Configure Mem0")
-def set_config(config: Dict[str, Any]):
+async def set_config(config: dict[str, Any]):
     """Set memory configuration."""
     global MEMORY_INSTANCE
-    MEMORY_INSTANCE = Memory.from_config(config)
+    MEMORY_INSTANCE = await asyncio.to_thread(build_memory, config, app.state)
+    await prepare_vector_store(MEMORY_INSTANCE, app.state)
+    _QCACHE.invalidate()
+    await invalidate_memory_cache()
     return {"message": "Configuration set successfully"}
 
 
 @app.post("/memories", summary="Create memories")
-def add_memory(memory_create: MemoryCreate):
+async def add_memory(memory_create: MemoryCreate):
     """Store new memories."""
     if not any([memory_create.user_id, memory_create.agent_id, memory_create.run_id]):
         raise HTTPException(
             status_code=400, detail="At least one identifier (user_id, agent_id, run_id) is required."
         )
 
-    params = {k: v for k, v in memory_create.model_dump().items() if v is not None and k != "messages"}
+    params = memory_create.model_dump(mode="json", exclude_none=True)
     try:
-        response = MEMORY_INSTANCE.add(messages=[m.model_dump() for m in memory_create.messages], **params)
-        return JSONResponse(content=response)
+        messages = params.pop("messages")
+        embeddings = {}
+        # Without inference mem0 embeds every message on its own; fetch them all in one call instead
+        if memory_create.infer is False and len(messages) > 1:
+            embeddings = await asyncio.to_thread(
+                batch_embed, MEMORY_INSTANCE.embedding_model, [m["content"] for m in messages if m["role"] != "system"]
+            )
+        with precomputed_embeddings(embeddings):
+            response = await asyncio.to_thread(MEMORY_INSTANCE.add, messages=messages, **params)
+        _QCACHE.invalidate(params)
+        # Inference may rewrite or remove existing memories
+        results = response.get("results", []) if isinstance(response, dict) else response
+        for result in results:
+            if result.get("event") in ("UPDATE", "DELETE"):
+                await invalidate_memory_cache(result["id"])
+        return response
     except Exception as e:
         logging.exception("Error in add_memory:")  # This will log the full traceback
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/memories", summary="Get memories")
-def get_all_memories(
-    user_id: Optional[str] = None,
-    run_id: Optional[str] = None,
-    agent_id: Optional[str] = None,
+async def get_all_memories(
+    user_id: str | None = None,
+    run_id: str | None = None,
+    agent_id: str | None = None,
 ):
     """Retrieve stored memories."""
     if not any([user_id, run_id, agent_id]):
         raise HTTPException(status_code=400, detail="At least one identifier is required.")
     try:
-        params = {k: v for k, v in {"user_id": user_id, "run_id": run_id, "agent_id": agent_id}.items() if v is not None}
-        return MEMORY_INSTANCE.get_all(**params)
+        params = _identifier_params(user_id, agent_id, run_id)
+        return await asyncio.to_thread(MEMORY_INSTANCE.get_all, **params)
     except Exception as e:
         logging.exception("Error in get_all_memories:")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/memories/{memory_id}", summary="Get a memory")
-def get_memory(memory_id: str):
+@cache(namespace="memory", key_builder=_memory_cache_key)
+async def get_memory(memory_id: str):
     """Retrieve a specific memory by ID."""
     try:
-        return MEMORY_INSTANCE.get(memory_id)
+        return await asyncio.to_thread(MEMORY_INSTANCE.get, memory_id)
     except Exception as e:
         logging.exception("Error in get_memory:")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/search", summary="Search memories")
-def search_memories(search_req: SearchRequest):
+async def search_memories(search_req: SearchRequest):
     """Search for memories based on a query."""
     try:
-        params = {k: v for k, v in search_req.model_dump().items() if v is not None and k != "query"}
-        return MEMORY_INSTANCE.search(query=search_req.query, **params)
+        params = search_req.model_dump(exclude_none=True, exclude={"query"})
+        scope = _search_cache_scope(params)
+        embedding = await asyncio.to_thread(MEMORY_INSTANCE.embedding_model.embed, search_req.query, "search")
+        unit_embedding = _unit_vector(embedding)
+        generation = _QCACHE.generation
+        cached = _QCACHE.get(scope, unit_embedding)
+        if cached is not None:
+            return cached
+        with precomputed_embeddings({search_req.query: embedding}):
+            response = await asyncio.to_thread(MEMORY_INSTANCE.search, query=search_req.query, **params)
+        _QCACHE.put(scope, unit_embedding, response, generation)
+        return response
     except Exception as e:
         logging.exception("Error in search_memories:")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.put("/memories/{memory_id}", summary="Update a memory")
-def update_memory(memory_id: str, updated_memory: Dict[str, Any]):
+async def update_memory(memory_id: str, updated_memory: dict[str, Any]):
     """Update an existing memory."""
     try:
-        return MEMORY_INSTANCE.update(memory_id=memory_id, data=updated_memory)
+        response = await asyncio.to_thread(MEMORY_INSTANCE.update, memory_id=memory_id, data=updated_memory)
+        _QCACHE.invalidate()
+        await invalidate_memory_cache(memory_id)
+        return response
     except Exception as e:
         logging.exception("Error in update_memory:")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/memories/{memory_id}/history", summary="Get memory history")
-def memory_history(memory_id: str):
+@cache(namespace="memory", key_builder=_memory_cache_key)
+async def memory_history(memory_id: str):
     """Retrieve memory history."""
     try:
-        return MEMORY_INSTANCE.history(memory_id=memory_id)
+        return await asyncio.to_thread(MEMORY_INSTANCE.history, memory_id=memory_id)
     except Exception as e:
         logging.exception("Error in memory_history:")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.delete("/memories/{memory_id}", summary="Delete a memory")
-def delete_memory(memory_id: str):
+async def delete_memory(memory_id: str):
     """Delete a specific memory by ID."""
     try:
-        MEMORY_INSTANCE.delete(memory_id=memory_id)
+        await asyncio.to_thread(MEMORY_INSTANCE.delete, memory_id=memory_id)
+        _QCACHE.invalidate()
+        await invalidate_memory_cache(memory_id)
         return {"message": "Memory deleted successfully"}
     except Exception as e:
         logging.exception("Error in delete_memory:")
@@ -267,17 +868,19 @@ def delete_memory(memory_id: str):
 
 
 @app.delete("/memories", summary="Delete all memories")
-def delete_all_memories(
-    user_id: Optional[str] = None,
-    run_id: Optional[str] = None,
-    agent_id: Optional[str] = None,
+async def delete_all_memories(
+    user_id: str | None = None,
+    run_id: str | None = None,
+    agent_id: str | None = None,
 ):
     """Delete all memories for a given identifier."""
     if not any([user_id, run_id, agent_id]):
         raise HTTPException(status_code=400, detail="At least one identifier is required.")
     try:
-        params = {k: v for k, v in {"user_id": user_id, "run_id": run_id, "agent_id": agent_id}.items() if v is not None}
-        MEMORY_INSTANCE.delete_all(**params)
+        params = _identifier_params(user_id, agent_id, run_id)
+        await asyncio.to_thread(MEMORY_INSTANCE.delete_all, **params)
+        _QCACHE.invalidate(params)
+        await invalidate_memory_cache()
         return {"message": "All relevant memories deleted"}
     except Exception as e:
         logging.exception("Error in delete_all_memories:")
@@ -285,17 +888,54 @@ def delete_all_memories(
 
 
 @app.post("/reset", summary="Reset all memories")
-def reset_memory():
+async def reset_memory():
     """Completely reset stored memories."""
     try:
-        MEMORY_INSTANCE.reset()
+        await asyncio.to_thread(MEMORY_INSTANCE.reset)
+        # reset() recreates the vector store and its table, so it needs tuning and indexing again
+        await asyncio.to_thread(configure_vector_store, MEMORY_INSTANCE, app.state)
+        await prepare_vector_store(MEMORY_INSTANCE, app.state)
+        _QCACHE.invalidate()
+        await invalidate_memory_cache()
         return {"message": "All memories reset"}
     except Exception as e:
         logging.exception("Error in reset_memory:")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Static responses for the endpoints health checks and uptime monitors hit most
+_DOCS_REDIRECT = RedirectResponse(url='/docs', status_code=307)
+_HEALTHZ_OK = PlainTextResponse(b"ok")
+
+
 @app.get("/", summary="Redirect to the OpenAPI documentation", include_in_schema=False)
-def home():
+async def home():
     """Redirect to the OpenAPI documentation."""
-    return RedirectResponse(url='/docs')
+    return _DOCS_REDIRECT
+
+
+@app.get("/healthz", summary="Liveness check", include_in_schema=False)
+async def healthz():
+    """Report that the server is up."""
+    return _HEALTHZ_OK
+
+
+if ENABLE_DEBUG_ENDPOINTS:
+
+    @app.post("/debug/explain", summary="Explain the search query plan", include_in_schema=False)
+    async def explain_search(search_req: SearchRequest):
+        """Run EXPLAIN ANALYZE on the live collection's pooled search to confirm the vector index is used."""
+        try:
+            identifiers = [getattr(search_req, key) for key in _IDENT]
+            embedding = await asyncio.to_thread(MEMORY_INSTANCE.embedding_model.embed, search_req.query, "search")
+            plan = await app.state.pool.fetchval(
+                "EXPLAIN (ANALYZE, FORMAT JSON) " + _pgvector_search_sql(MEMORY_INSTANCE.vector_store.collection_name),
+                str(embedding),
+                100,
+                *identifiers,
+                _payload_filters_param(search_req.filters),
+            )
+            return json.loads(plan)
+        except Exception as e:
+            logging.exception("Error in explain_search:")
+            raise HTTPException(status_code=500, detail=str(e))
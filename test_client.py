@@ -1,71 +1,118 @@
 #!/usr/bin/env python3
-import requests
+# Requires: pip install "httpx[http2]"
+import asyncio
 import json
 import sys
+import time
+
+import httpx
 
 # Replace with your Railway deployment URL
 API_URL = "YOUR_RAILWAY_DEPLOYMENT_URL"
 
-def create_memory(user_id, message_content):
+# Maximum number of requests in flight during a benchmark
+BENCH_CONCURRENCY = 32
+
+async def create_memory(client, user_id, message_content):
     """Create a new memory in Mem0."""
-    url = f"{API_URL}/memories"
     payload = {
         "messages": [
             {"role": "user", "content": message_content}
         ],
         "user_id": user_id
     }
-    
-    response = requests.post(url, json=payload)
+
+    response = await client.post("/memories", json=payload)
     return response.json()
 
-def search_memories(user_id, query):
+async def search_memories(client, user_id, query):
     """Search for memories in Mem0."""
-    url = f"{API_URL}/search"
     payload = {
         "query": query,
         "user_id": user_id
     }
-    
-    response = requests.post(url, json=payload)
+
+    response = await client.post("/search", json=payload)
     return response.json()
 
-def get_all_memories(user_id):
+async def get_all_memories(client, user_id):
     """Get all memories for a user."""
-    url = f"{API_URL}/memories"
     params = {"user_id": user_id}
-    
-    response = requests.get(url, params=params)
+
+    response = await client.get("/memories", params=params)
     return response.json()
 
+async def bench_create(client, user_id, path):
+    """Create one memory per line of a file, with up to BENCH_CONCURRENCY requests in flight."""
+    with open(path) as f:
+        messages = [line.strip() for line in f if line.strip()]
+
+    semaphore = asyncio.Semaphore(BENCH_CONCURRENCY)
+
+    async def create(message):
+        async with semaphore:
+            try:
+                response = await client.post(
+                    "/memories",
+                    json={"messages": [{"role": "user", "content": message}], "user_id": user_id},
+                )
+                return response.is_success
+            except httpx.HTTPError:
+                return False
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(create(m) for m in messages))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": len(results),
+        "failed": results.count(False),
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(results) / elapsed, 2) if elapsed else None,
+    }
+
 def print_usage():
     print("Usage:")
     print(f"  {sys.argv[0]} create <user_id> <message>   - Create a new memory")
     print(f"  {sys.argv[0]} search <user_id> <query>     - Search memories")
     print(f"  {sys.argv[0]} list <user_id>               - List all memories")
+    print(f"  {sys.argv[0]} bench <user_id> <file>       - Create one memory per line of <file> concurrently")
 
-if __name__ == "__main__":
+async def main():
     if len(sys.argv) < 3:
         print_usage()
         sys.exit(1)
-    
+
     command = sys.argv[1]
     user_id = sys.argv[2]
-    
-    if command == "create" and len(sys.argv) >= 4:
-        message = sys.argv[3]
-        result = create_memory(user_id, message)
-        print(json.dumps(result, indent=2))
-    
-    elif command == "search" and len(sys.argv) >= 4:
-        query = sys.argv[3]
-        result = search_memories(user_id, query)
-        print(json.dumps(result, indent=2))
-    
-    elif command == "list":
-        result = get_all_memories(user_id)
-        print(json.dumps(result, indent=2))
-    
-    else:
-        print_usage()
-        sys.exit(1) 
\ No newline at end of file
+
+    # One client for the whole run so connections are reused across requests
+    async with httpx.AsyncClient(
+        base_url=API_URL,
+        http2=True,
+        timeout=None,
+        limits=httpx.Limits(max_connections=64),
+    ) as client:
+        if command == "create" and len(sys.argv) >= 4:
+            message = sys.argv[3]
+            result = await create_memory(client, user_id, message)
+            print(json.dumps(result, indent=2))
+
+        elif command == "search" and len(sys.argv) >= 4:
+            query = sys.argv[3]
+            result = await search_memories(client, user_id, query)
+            print(json.dumps(result, indent=2))
+
+        elif command == "list":
+            result = await get_all_memories(client, user_id)
+            print(json.dumps(result, indent=2))
+
+        elif command == "bench" and len(sys.argv) >= 4:
+            result = await bench_create(client, user_id, sys.argv[3])
+            print(json.dumps(result, indent=2))
+
+        else:
+            print_usage()
+            sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())